@@ -527,7 +527,7 @@ export function KlotskiPuzzle({
         fontSize: '12px',
         opacity: 0.8,
       }}>
-        State: {currentNode.id.substring(0, 16)}...
+        State: #{currentNode.id}
       </div>
       
       {/* Board */}
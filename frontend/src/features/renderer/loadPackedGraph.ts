@@ -3,11 +3,14 @@
  * 
  * Binary format:
  * - Header (20 bytes): magic, version, counts, board dimensions, position scale
- * - Pieces: width/height for each piece
- * - Node IDs: 16 bytes (hex) per node
- * - Node piece positions: 2 bytes per piece per node
+ * - Pieces: 1 byte (width << 4 | height) per piece
+ * - Node piece positions: 1 byte (x << 4 | y) per piece per node
  * - 3D positions: 6 bytes (int16 x,y,z) per node  
- * - Edges: 9 bytes (source u32, target u32, piece_id u8) per edge
+ * - Edges in CSR form, one block per column: u32 offsets (nodeCount + 1),
+ *   then u32 targets, u8 piece ids and u8 directions per edge. Node i owns
+ *   edges offsets[i] to offsets[i + 1], so sources are not stored.
+ *
+ * Nodes have no stored ID; a node is identified by its index in the file.
  */
 
 export interface PackedGraphMetadata {
@@ -26,7 +29,7 @@ export interface PackedPiece {
 }
 
 export interface PackedNode {
-  id: string;
+  id: string;  // Node index as string
   positions: Array<[number, number]>;  // Piece positions on board
   x: number;  // 3D position
   y: number;
@@ -100,7 +103,6 @@ export async function loadPackedGraph(url: string): Promise<PackedGraphData> {
  */
 function parsePackedGraph(buffer: ArrayBuffer): PackedGraphData {
   const view = new DataView(buffer);
-  const bytes = new Uint8Array(buffer);
   let offset = 0;
 
   // Read magic bytes
@@ -114,7 +116,7 @@ function parsePackedGraph(buffer: ArrayBuffer): PackedGraphData {
 
   // Read header
   const version = view.getUint16(offset, true); offset += 2;
-  if (version !== 1) {
+  if (version !== 4) {
     throw new Error(`Unsupported version: ${version}`);
   }
 
@@ -128,38 +130,26 @@ function parsePackedGraph(buffer: ArrayBuffer): PackedGraphData {
 
   console.log(`Loading packed graph: ${nodeCount} nodes, ${edgeCount} edges, ${pieceCount} pieces`);
 
-  // Read pieces
+  // Read pieces (1 byte each: width in high nibble, height in low nibble)
   const pieces: PackedPiece[] = [];
   for (let i = 0; i < pieceCount; i++) {
+    const packed = view.getUint8(offset);
     pieces.push({
       id: i,
-      width: view.getUint8(offset),
-      height: view.getUint8(offset + 1),
+      width: packed >> 4,
+      height: packed & 0x0F,
     });
-    offset += 2;
+    offset += 1;
   }
 
-  // Read node IDs (16 bytes each as hex string)
-  const nodeIds: string[] = [];
-  for (let i = 0; i < nodeCount; i++) {
-    let hex = '';
-    for (let j = 0; j < 16; j++) {
-      hex += bytes[offset + j].toString(16).padStart(2, '0');
-    }
-    nodeIds.push(hex);
-    offset += 16;
-  }
-
-  // Read node piece positions (pieceCount * 2 bytes per node)
+  // Read node piece positions (pieceCount bytes per node: x << 4 | y)
   const nodePiecePositions: Array<Array<[number, number]>> = [];
   for (let i = 0; i < nodeCount; i++) {
     const positions: Array<[number, number]> = [];
     for (let p = 0; p < pieceCount; p++) {
-      positions.push([
-        view.getUint8(offset),
-        view.getUint8(offset + 1),
-      ]);
-      offset += 2;
+      const packed = view.getUint8(offset);
+      positions.push([packed >> 4, packed & 0x0F]);
+      offset += 1;
     }
     nodePiecePositions.push(positions);
   }
@@ -174,28 +164,40 @@ function parsePackedGraph(buffer: ArrayBuffer): PackedGraphData {
     offset += 6;
   }
 
-  // Combine into nodes array
-  const nodes: PackedNode[] = nodeIds.map((id, i) => ({
-    id,
+  // Combine into nodes array, nodes are identified by their index
+  const nodes: PackedNode[] = node3DPositions.map((pos, i) => ({
+    id: String(i),
     positions: nodePiecePositions[i],
-    ...node3DPositions[i],
+    ...pos,
   }));
 
-  // Read edges (10 bytes each: source u32, target u32, piece_id u8, direction u8)
+  // Read edge offsets (4 bytes per node + 1: u32 CSR row pointers)
+  const edgeOffsets = new Uint32Array(nodeCount + 1);
+  for (let i = 0; i <= nodeCount; i++) {
+    edgeOffsets[i] = view.getUint32(offset, true);
+    offset += 4;
+  }
+
+  // Edge columns: u32 targets, then u8 piece ids, then u8 directions
+  const targetsOffset = offset;
+  const pieceIdsOffset = targetsOffset + edgeCount * 4;
+  const directionsOffset = pieceIdsOffset + edgeCount;
+
+  // Rebuild the edge list, the source of each edge is its CSR row
   const directionMap = ['up', 'down', 'left', 'right'];
   const edges: PackedEdge[] = [];
-  for (let i = 0; i < edgeCount; i++) {
-    const srcIdx = view.getUint32(offset, true);
-    const tgtIdx = view.getUint32(offset + 4, true);
-    const pieceId = view.getUint8(offset + 8);
-    const directionCode = view.getUint8(offset + 9);
-    edges.push({
-      source: nodeIds[srcIdx],
-      target: nodeIds[tgtIdx],
-      piece_id: pieceId,
-      direction: directionMap[directionCode] || 'unknown',
-    });
-    offset += 10;
+  for (let srcIdx = 0; srcIdx < nodeCount; srcIdx++) {
+    for (let i = edgeOffsets[srcIdx]; i < edgeOffsets[srcIdx + 1]; i++) {
+      const tgtIdx = view.getUint32(targetsOffset + i * 4, true);
+      const pieceId = view.getUint8(pieceIdsOffset + i);
+      const directionCode = view.getUint8(directionsOffset + i);
+      edges.push({
+        source: String(srcIdx),
+        target: String(tgtIdx),
+        piece_id: pieceId,
+        direction: directionMap[directionCode] || 'unknown',
+      });
+    }
   }
 
   return {
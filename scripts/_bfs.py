@@ -0,0 +1,163 @@
+"""
+Numba-compiled BFS over Klotski bitboard states.
+
+States are int64 arrays holding one occupancy mask per piece (see
+KlotskiState.masks). Visited states are keyed by a single int64 in which
+every board cell holds the shape code of the piece covering it (0 = empty),
+so the board must fit in 63 bits (4x5 with four shapes needs 60).
+
+Requires numba; compute_klotski.py falls back to _frontier.py without it.
+"""
+
+import numpy as np
+from numba import njit, types
+from numba.typed import Dict
+
+
+@njit(cache=True)
+def _spread(mask, code, bits):
+    """Write `code` into the `bits`-wide slot of every cell set in `mask`"""
+    out = np.int64(0)
+    cell = 0
+    while mask:
+        if mask & 1:
+            out |= code << (bits * cell)
+        mask >>= 1
+        cell += 1
+    return out
+
+
+@njit(cache=True)
+def _state_key(state, codes, bits):
+    """Packed key of a whole state"""
+    key = np.int64(0)
+    for i in range(state.shape[0]):
+        key |= _spread(state[i], codes[i], bits)
+    return key
+
+
+@njit(cache=True)
+def gen_moves(state, walls, shifts, out_pieces, out_dirs, out_masks):
+    """
+    Write every legal move of `state` into the preallocated output arrays
+    (moved piece index, direction index, new mask).
+    Returns the number of moves written.
+    """
+    occupied = np.int64(0)
+    for i in range(state.shape[0]):
+        occupied |= state[i]
+
+    count = 0
+    for i in range(state.shape[0]):
+        mask = state[i]
+        others = occupied ^ mask
+        for d in range(walls.shape[0]):
+            # Piece already touches the wall on this side
+            if mask & walls[d]:
+                continue
+
+            shift = shifts[d]
+            new_mask = mask << shift if shift > 0 else mask >> -shift
+            if new_mask & others:
+                continue
+
+            out_pieces[count] = i
+            out_dirs[count] = d
+            out_masks[count] = new_mask
+            count += 1
+    return count
+
+
+@njit(cache=True)
+def bfs(initial, codes, bits, cell_count, walls, shifts):
+    """
+    Breadth-first search over all states reachable from `initial`.
+
+    States are stored in discovery order, and since a BFS pops them in the
+    same order, the state array doubles as the queue.
+    `cell_count` is unused here (_spread stops at the highest set cell) and
+    only keeps the signature in line with _frontier.bfs.
+    Returns (states, edge_offsets, edge_tgt, edge_piece, edge_dir) with edges
+    in CSR form: state i owns edges edge_offsets[i] to edge_offsets[i + 1].
+    """
+    piece_count = initial.shape[0]
+    max_moves = piece_count * walls.shape[0]
+
+    states = np.empty((1024, piece_count), dtype=np.int64)
+    keys = np.empty(1024, dtype=np.int64)
+    edge_offsets = np.empty(1025, dtype=np.int64)
+    edge_offsets[0] = 0
+    states[0] = initial
+    keys[0] = _state_key(initial, codes, bits)
+    visited = Dict.empty(key_type=types.int64, value_type=types.int64)
+    visited[keys[0]] = 0
+    count = 1
+
+    edge_tgt = np.empty(4096, dtype=np.int64)
+    edge_piece = np.empty(4096, dtype=np.uint8)
+    edge_dir = np.empty(4096, dtype=np.uint8)
+    edge_count = 0
+
+    move_pieces = np.empty(max_moves, dtype=np.int64)
+    move_dirs = np.empty(max_moves, dtype=np.int64)
+    move_masks = np.empty(max_moves, dtype=np.int64)
+
+    head = 0
+    while head < count:
+        state = states[head]
+        key = keys[head]
+        move_count = gen_moves(state, walls, shifts, move_pieces, move_dirs, move_masks)
+
+        # Grow edge buffers so this state's moves fit
+        if edge_count + move_count > edge_tgt.shape[0]:
+            size = edge_tgt.shape[0] * 2
+            edge_tgt = _grow(edge_tgt, size)
+            edge_piece = _grow(edge_piece, size)
+            edge_dir = _grow(edge_dir, size)
+
+        for m in range(move_count):
+            i = move_pieces[m]
+            # Only piece i moved, so swap its cells in the key
+            new_key = key ^ _spread(state[i], codes[i], bits) ^ _spread(move_masks[m], codes[i], bits)
+
+            target = visited.get(new_key, -1)
+            if target < 0:
+                if count == states.shape[0]:
+                    states = _grow_rows(states, count * 2)
+                    keys = _grow(keys, count * 2)
+                    edge_offsets = _grow(edge_offsets, count * 2 + 1)
+                    # Growing reallocates, so refresh the view of the current state
+                    state = states[head]
+                states[count] = state
+                states[count, i] = move_masks[m]
+                keys[count] = new_key
+                visited[new_key] = count
+                target = count
+                count += 1
+
+            edge_tgt[edge_count] = target
+            edge_piece[edge_count] = i
+            edge_dir[edge_count] = move_dirs[m]
+            edge_count += 1
+
+        head += 1
+        edge_offsets[head] = edge_count
+
+    return (states[:count], edge_offsets[:count + 1], edge_tgt[:edge_count],
+            edge_piece[:edge_count], edge_dir[:edge_count])
+
+
+@njit(cache=True)
+def _grow(array, size):
+    """Copy a 1-D array into a larger buffer"""
+    out = np.empty(size, dtype=array.dtype)
+    out[:array.shape[0]] = array
+    return out
+
+
+@njit(cache=True)
+def _grow_rows(array, rows):
+    """Copy a 2-D array into a buffer with more rows"""
+    out = np.empty((rows, array.shape[1]), dtype=array.dtype)
+    out[:array.shape[0]] = array
+    return out
@@ -0,0 +1,107 @@
+"""
+Vectorized BFS over Klotski bitboard states with NumPy.
+
+Same inputs, keys and outputs as the compiled BFS in _bfs.py, but instead
+of looping over states it expands a whole BFS level at once: every
+(state, piece, direction) candidate of the level is checked with array
+operations, and the visited check runs on the level's unique keys.
+
+Visited keys are kept as a sorted array, so lookups are a searchsorted and
+new keys are merged in with one insert per level.
+"""
+
+import numpy as np
+
+
+def spread(masks, bits, cell_count):
+    """Set the lowest bit of the `bits`-wide slot of every cell set in `masks`"""
+    cells = np.arange(cell_count, dtype=np.int64)
+    slots = np.int64(1) << (bits * cells)
+    return (((masks[:, None] >> cells) & 1) * slots).sum(axis=1)
+
+
+def expand_frontier(frontier, walls, shifts):
+    """
+    Find every legal move of an (F, P) array of states.
+    Returns (rows, pieces, dirs, new_masks), one entry per move, ordered by
+    state, then piece, then direction like the serial BFS generates them.
+    """
+    occupied = np.bitwise_or.reduce(frontier, axis=1)
+    masks = frontier[:, :, None]
+    others = (occupied[:, None] ^ frontier)[:, :, None]
+
+    # (F, P, D) candidates; shifting a piece that touches the wall on that
+    # side wraps it around the board, but the wall test discards those
+    shifted = np.where(shifts > 0,
+                       masks << np.maximum(shifts, 0),
+                       masks >> np.maximum(-shifts, 0))
+    legal = ((masks & walls) == 0) & ((shifted & others) == 0)
+
+    rows, pieces, dirs = np.nonzero(legal)
+    return rows, pieces, dirs, shifted[rows, pieces, dirs]
+
+
+def bfs(initial, codes, bits, cell_count, walls, shifts):
+    """
+    Level-synchronous breadth-first search over all states reachable from
+    `initial`.
+
+    New states of a level are numbered in the order their first move
+    appears, which is the order a FIFO BFS discovers them in.
+    `cell_count` is the number of board cells, the slots spread() fills.
+    Returns (states, edge_offsets, edge_tgt, edge_piece, edge_dir) with edges
+    in CSR form: state i owns edges edge_offsets[i] to edge_offsets[i + 1].
+    """
+    frontier = initial[None, :]
+    frontier_keys = (spread(initial, bits, cell_count) * codes).sum(keepdims=True)
+    visited_keys = frontier_keys.copy()
+    visited_idx = np.zeros(1, dtype=np.int64)
+    count = 1
+
+    states = [frontier]
+    edge_counts = []
+    edge_tgt = []
+    edge_piece = []
+    edge_dir = []
+
+    while frontier.shape[0]:
+        level_size = frontier.shape[0]
+        rows, pieces, dirs, new_masks = expand_frontier(frontier, walls, shifts)
+        old_masks = frontier[rows, pieces]
+        # Only the moved piece changes, so swap its cells in the key
+        new_keys = frontier_keys[rows] ^ (
+            (spread(old_masks, bits, cell_count) ^ spread(new_masks, bits, cell_count))
+            * codes[pieces]
+        )
+
+        unique_keys, first, inverse = np.unique(new_keys, return_index=True, return_inverse=True)
+        pos = np.searchsorted(visited_keys, unique_keys)
+        found = np.minimum(pos, visited_keys.shape[0] - 1)
+        seen = visited_keys[found] == unique_keys
+
+        # Number unseen keys by their first move in the level
+        fresh = np.flatnonzero(~seen)
+        fresh = fresh[np.argsort(first[fresh])]
+        targets = np.where(seen, visited_idx[found], 0)
+        targets[fresh] = np.arange(count, count + fresh.shape[0])
+        count += fresh.shape[0]
+
+        visited_keys = np.insert(visited_keys, pos[~seen], unique_keys[~seen])
+        visited_idx = np.insert(visited_idx, pos[~seen], targets[~seen])
+
+        moves = first[fresh]
+        frontier = frontier[rows[moves]]
+        frontier[np.arange(moves.shape[0]), pieces[moves]] = new_masks[moves]
+        frontier_keys = unique_keys[fresh]
+        states.append(frontier)
+
+        edge_counts.append(np.bincount(rows, minlength=level_size))
+        edge_tgt.append(targets[inverse])
+        edge_piece.append(pieces.astype(np.uint8))
+        edge_dir.append(dirs.astype(np.uint8))
+
+    edge_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(edge_counts), out=edge_offsets[1:])
+
+    return (np.concatenate(states), edge_offsets, np.concatenate(edge_tgt),
+            np.concatenate(edge_piece), np.concatenate(edge_dir))
@@ -5,11 +5,42 @@ This program takes a Klotski puzzle setup and computes the complete state space,
 generating a JSON file with nodes (puzzle states) and edges (valid moves).
 """
 
+import argparse
 import json
-from typing import List, Tuple, Set, Dict
-from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Tuple, Dict, Optional
 from dataclasses import dataclass, asdict
-import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+import _frontier
+
+# Numba is optional; without it the BFS runs on NumPy arrays (_frontier.py)
+try:
+    import _bfs
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+# States handed to a worker process per task in the parallel BFS
+CHUNK_SIZE = 1024
+
+# BFS implementations compute_state_space can run; 'auto' picks the fastest available
+BACKENDS = ('auto', 'numba', 'numpy', 'python')
+
+# Direction codes, shared with the packed binary format (pack_graph.py)
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+
+# Move directions as (dx, dy, code), in the order moves are generated
+DIRECTIONS = [
+    (-1, 0, LEFT),
+    (1, 0, RIGHT),
+    (0, -1, UP),
+    (0, 1, DOWN)
+]
 
 
 @dataclass
@@ -20,32 +51,81 @@ class Piece:
     y: int  # top-left y coordinate
     width: int
     height: int
-    
-    def get_positions(self) -> Set[Tuple[int, int]]:
-        """Returns all grid positions occupied by this piece"""
-        positions = set()
-        for dx in range(self.width):
-            for dy in range(self.height):
-                positions.add((self.x + dx, self.y + dy))
-        return positions
+
+
+def piece_mask(x: int, y: int, width: int, height: int, board_width: int) -> int:
+    """Bitboard of the cells covered by a piece (bit index = y * board_width + x)"""
+    row = (1 << width) - 1
+    mask = 0
+    for dy in range(height):
+        mask |= row << ((y + dy) * board_width + x)
+    return mask
+
+
+@lru_cache(maxsize=None)
+def wall_masks(board_width: int, board_height: int) -> Tuple[int, ...]:
+    """
+    For each direction in DIRECTIONS, the cells from which a move in that
+    direction would leave the board
+    """
+    left_column = piece_mask(0, 0, 1, board_height, board_width)
+    top_row = piece_mask(0, 0, board_width, 1, board_width)
+    return (
+        left_column,
+        left_column << (board_width - 1),
+        top_row,
+        top_row << (board_width * (board_height - 1))
+    )
+
+
+def key_bits(class_count: int) -> int:
+    """Bits per cell needed to store a shape code (class + 1) or empty"""
+    return class_count.bit_length()
+
+
+def fits_in_key(cell_count: int, class_count: int) -> bool:
+    """Whether a board can be packed into the int64 keys of the array BFS"""
+    return cell_count * key_bits(class_count) <= 63
 
 
 class KlotskiState:
     """Represents a state of the Klotski puzzle"""
     
-    def __init__(self, pieces: List[Piece], board_width: int = 4, board_height: int = 5):
+    def __init__(self, pieces: List[Piece], board_width: int = 4, board_height: int = 5,
+                 shape_classes: Optional[Dict[Tuple[int, int], int]] = None,
+                 masks: Optional[List[int]] = None):
         self.pieces = pieces
         self.board_width = board_width
         self.board_height = board_height
+        # Shape (width, height) -> class index used by to_key, shared by all successors
+        if shape_classes is None:
+            shapes = sorted({(p.width, p.height) for p in pieces})
+            shape_classes = {shape: i for i, shape in enumerate(shapes)}
+        self.shape_classes = shape_classes
+        # Per-piece occupancy bitboards, in the same order as pieces
+        if masks is None:
+            masks = [piece_mask(p.x, p.y, p.width, p.height, board_width) for p in pieces]
+        self.masks = masks
+        # Filled by to_key on first use; pieces are never moved in place
+        self._key: Optional[int] = None
     
-    def to_tuple(self) -> Tuple:
-        """Convert state to hashable tuple representation"""
-        return tuple(sorted((p.x, p.y, p.width, p.height) for p in self.pieces))
-    
-    def to_hash(self) -> str:
-        """Generate a unique hash for this state"""
-        state_str = str(self.to_tuple())
-        return hashlib.md5(state_str.encode()).hexdigest()
+    def to_key(self) -> int:
+        """
+        Pack the board into a single integer key.
+        The key concatenates one occupancy bitboard per piece shape. A region
+        covered by pieces of one shape can only be tiled one way, so pieces of
+        equal shape are interchangeable: swapping two of them gives the same key.
+        Left-right mirror images deliberately get different keys: the viewer
+        and data/node_positions.json need every orientation as its own node.
+        The key is computed once and cached on the state.
+        """
+        if self._key is None:
+            cell_count = self.board_width * self.board_height
+            key = 0
+            for piece, mask in zip(self.pieces, self.masks):
+                key |= mask << (self.shape_classes[(piece.width, piece.height)] * cell_count)
+            self._key = key
+        return self._key
     
     def to_dict(self) -> Dict:
         """Convert state to dictionary for JSON serialization"""
@@ -59,152 +139,294 @@ class KlotskiState:
         sorted_pieces = sorted(self.pieces, key=lambda p: p.id)
         return [[p.x, p.y] for p in sorted_pieces]
     
-    def get_occupied_positions(self) -> Dict[Tuple[int, int], int]:
-        """Returns a map of position -> piece_id"""
-        occupied = {}
-        for piece in self.pieces:
-            for pos in piece.get_positions():
-                occupied[pos] = piece.id
-        return occupied
-    
-    def is_valid_position(self, piece_id: int, new_x: int, new_y: int, 
-                         piece_width: int, piece_height: int) -> bool:
-        """Check if a piece can be placed at given position"""
-        # Check board boundaries
-        if new_x < 0 or new_y < 0:
-            return False
-        if new_x + piece_width > self.board_width:
-            return False
-        if new_y + piece_height > self.board_height:
-            return False
-        
-        # Check collision with other pieces
-        occupied = self.get_occupied_positions()
-        for dx in range(piece_width):
-            for dy in range(piece_height):
-                pos = (new_x + dx, new_y + dy)
-                if pos in occupied and occupied[pos] != piece_id:
-                    return False
-        
-        return True
-    
-    def get_possible_moves(self) -> List[Tuple['KlotskiState', int, str]]:
-        """
-        Generate all possible next states from current state.
-        Returns list of (new_state, piece_id, direction)
-        """
-        moves = []
-        
-        for piece in self.pieces:
-            # Try moving in all four directions
-            directions = [
-                (-1, 0, 'left'),
-                (1, 0, 'right'),
-                (0, -1, 'up'),
-                (0, 1, 'down')
-            ]
-            
-            for dx, dy, direction in directions:
-                new_x = piece.x + dx
-                new_y = piece.y + dy
-                
-                if self.is_valid_position(piece.id, new_x, new_y, piece.width, piece.height):
-                    # Create new state with moved piece
-                    new_pieces = []
-                    for p in self.pieces:
-                        if p.id == piece.id:
-                            new_pieces.append(Piece(p.id, new_x, new_y, 
-                                                   p.width, p.height))
-                        else:
-                            new_pieces.append(Piece(p.id, p.x, p.y, 
-                                                   p.width, p.height))
-                    
-                    new_state = KlotskiState(new_pieces, 
-                                            self.board_width, 
-                                            self.board_height)
-                    moves.append((new_state, piece.id, direction))
-        
-        return moves
+    def with_masks(self, masks: Tuple[int, ...]) -> 'KlotskiState':
+        """Create the state with the same pieces placed at the given per-piece masks"""
+        pieces = []
+        for piece, mask in zip(self.pieces, masks):
+            # The lowest set bit of a mask is the piece's top-left cell
+            cell = (mask & -mask).bit_length() - 1
+            pieces.append(Piece(piece.id, cell % self.board_width, cell // self.board_width,
+                                piece.width, piece.height))
+        return KlotskiState(pieces, self.board_width, self.board_height,
+                            self.shape_classes, list(masks))
     
     def visualize(self) -> str:
         """Create a visual representation of the board"""
         board = [['.' for _ in range(self.board_width)] 
                 for _ in range(self.board_height)]
         
-        for piece in self.pieces:
+        for piece, mask in zip(self.pieces, self.masks):
             symbol = str(piece.id) if piece.id < 10 else chr(65 + piece.id - 10)
-            for pos in piece.get_positions():
-                x, y = pos
-                board[y][x] = symbol
+            for cell in range(self.board_width * self.board_height):
+                if mask >> cell & 1:
+                    board[cell // self.board_width][cell % self.board_width] = symbol
         
         return '\n'.join(''.join(row) for row in board)
 
 
+# Placement mask -> in-bounds (new_mask, direction) shifts, for one piece shape
+MoveTable = Dict[int, Tuple[Tuple[int, int], ...]]
+
+
+def build_move_table(width: int, height: int, board_width: int, board_height: int) -> MoveTable:
+    """
+    For every placement of a width x height piece, the masks it can shift to
+    without leaving the board, in DIRECTIONS order
+    """
+    table = {}
+    for y in range(board_height - height + 1):
+        for x in range(board_width - width + 1):
+            shifts = []
+            for dx, dy, direction in DIRECTIONS:
+                new_x, new_y = x + dx, y + dy
+                if (0 <= new_x and new_x + width <= board_width
+                        and 0 <= new_y and new_y + height <= board_height):
+                    shifts.append((piece_mask(new_x, new_y, width, height, board_width), direction))
+            table[piece_mask(x, y, width, height, board_width)] = tuple(shifts)
+    return table
+
+
+def get_possible_moves(key: int, state: Tuple[int, ...], move_tables: Tuple[MoveTable, ...],
+                       key_offsets: Tuple[int, ...]) -> List[Tuple[int, int, int]]:
+    """
+    Generate all possible next states from a state given as its key and a
+    tuple of per-piece masks (see KlotskiState.masks), using each piece's
+    move table.
+    Returns list of (new_key, piece_index, direction_code); the new masks
+    can be recovered from the key, see KlotskiSolver._add_moves.
+    
+    Pieces of equal shape need no deduplication here: every move empties a
+    different set of cells, so no two moves of one state lead to the same
+    key. Permutations of equal pieces are merged by the shape-indexed key.
+    """
+    occupied = 0
+    for mask in state:
+        occupied |= mask
+    
+    moves = []
+    for i, mask in enumerate(state):
+        others = occupied ^ mask
+        
+        for new_mask, direction in move_tables[i][mask]:
+            if new_mask & others:
+                continue
+            
+            # Only piece i moved, so swap its bits in the key
+            moves.append((key ^ ((mask ^ new_mask) << key_offsets[i]), i, direction))
+    
+    return moves
+
+
+def expand_states(keys: List[int], states: List[Tuple[int, ...]],
+                  move_tables: Tuple[MoveTable, ...], key_offsets: Tuple[int, ...]
+                  ) -> List[List[Tuple[int, int, int]]]:
+    """
+    Generate the moves of a chunk of states (runs in a worker process).
+    Only (new_key, piece_index, direction_code) records are sent back, since
+    pickling full successor states costs more than the serial BFS.
+    """
+    return [get_possible_moves(key, state, move_tables, key_offsets)
+            for key, state in zip(keys, states)]
+
+
 class KlotskiSolver:
     """Computes the complete state space of a Klotski puzzle"""
     
     def __init__(self, initial_state: KlotskiState):
         self.initial_state = initial_state
-        self.visited_states: Dict[str, KlotskiState] = {}
-        self.edges: List[Dict] = []
+        self.board_width = initial_state.board_width
+        self.walls = wall_masks(initial_state.board_width, initial_state.board_height)
+        self.piece_ids = [p.id for p in initial_state.pieces]
+        # Shapes never change, so every in-bounds shift is looked up, not computed
+        shape_tables = {
+            shape: build_move_table(*shape, initial_state.board_width, initial_state.board_height)
+            for shape in initial_state.shape_classes
+        }
+        self.move_tables = tuple(shape_tables[(p.width, p.height)] for p in initial_state.pieces)
+        # Bit offset of each piece's shape bitboard inside a state key (see to_key)
+        cell_count = initial_state.board_width * initial_state.board_height
+        self.key_offsets = tuple(
+            initial_state.shape_classes[(p.width, p.height)] * cell_count
+            for p in initial_state.pieces
+        )
+        # State key -> dense node index, assigned in discovery order
+        self.key_to_idx: Dict[int, int] = {}
+        # Node index -> per-piece masks
+        self.states: List[Tuple[int, ...]] = []
+        # Node index -> state key
+        self.keys: List[int] = []
+        # Edges in CSR form: the edges of node i are entries
+        # edge_offsets[i]:edge_offsets[i + 1] of the other columns
+        self.edge_offsets: List[int] = [0]
+        self.edge_tgt: List[int] = []
+        self.edge_piece: List[int] = []
+        self.edge_dir: List[int] = []
     
-    def compute_state_space(self) -> Dict:
+    def compute_state_space(self, backend: str = 'auto', workers: int = 1) -> Dict:
         """
         Compute the complete state space using BFS.
+        The backend is one of BACKENDS: 'numba' runs the compiled BFS from
+        _bfs.py, 'numpy' the vectorized BFS from _frontier.py (both need the
+        board to fit 64-bit keys), and 'python' a Python BFS that expands
+        each level on `workers` processes. 'auto' picks the first of these
+        that can run.
         Returns a dictionary with nodes and edges for JSON export.
         """
-        queue = deque([self.initial_state])
-        queued_states : set = set([self.initial_state.to_hash()])
+        cell_count = self.initial_state.board_width * self.initial_state.board_height
+        class_count = len(self.initial_state.shape_classes)
+        array_bfs = fits_in_key(cell_count, class_count)
         
-        state_count = 0
+        if backend == 'auto':
+            if array_bfs:
+                backend = 'numba' if HAS_NUMBA else 'numpy'
+            else:
+                backend = 'python'
+        elif backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        if backend == 'numba' and not HAS_NUMBA:
+            raise ValueError("The numba backend needs numba installed")
+        if backend in ('numba', 'numpy') and not array_bfs:
+            raise ValueError(f"The board is too large for 64-bit keys, "
+                             f"the {backend} backend cannot run")
         
-        print("Computing state space...")
+        print(f"Computing state space ({backend} backend)...")
         
-        while queue:
-            current_state = queue.popleft()
-            current_hash = current_state.to_hash()
-            queued_states.remove(current_hash)
+        if backend == 'numba':
+            self._run_array_bfs(_bfs.bfs)
+        elif backend == 'numpy':
+            self._run_array_bfs(_frontier.bfs)
+        elif workers > 1:
+            self._run_parallel_bfs(workers)
+        else:
+            self._run_python_bfs()
+        
+        print("\nState space computation complete!")
+        print(f"Total unique states: {len(self.states)}")
+        print(f"Total edges: {len(self.edge_tgt)}")
+        
+        return self.create_graph_json()
+    
+    def _add_initial_state(self) -> None:
+        """Register the initial state as node 0"""
+        initial_key = self.initial_state.to_key()
+        initial_masks = tuple(self.initial_state.masks)
+        self.key_to_idx[initial_key] = 0
+        self.keys.append(initial_key)
+        self.states.append(initial_masks)
+    
+    def _run_python_bfs(self) -> None:
+        """Fill the nodes and edges with a pure Python BFS"""
+        # States are marked visited when discovered and stored in discovery
+        # order, which is also the order a BFS processes them in, so the node
+        # list doubles as the queue: everything from `head` on is still queued
+        self._add_initial_state()
+        head = 0
+        
+        while head < len(self.states):
+            current_state = self.states[head]
+            current_key = self.keys[head]
             
-            state_count += 1
+            state_count = head + 1
             if state_count % 1000 == 0:
                 print(f"Processed {state_count} states, "
-                      f"Queue size: {len(queue)}, "
-                      f"Total unique states: {len(self.visited_states)}")
+                      f"Queue size: {len(self.states) - state_count}, "
+                      f"Total discovered states: {len(self.states)}")
                 
             if state_count % 50000 == 0:
                 print(f"--- Reached {state_count} states ---")
                 with open("visited_states_visualization.txt", 'w') as vis_file:
-                    for state_hash, state in self.visited_states.items():
-                        vis_file.write(f"State Hash: {state_hash}\n")
-                        vis_file.write(state.visualize() + "\n\n")
+                    for state_key, idx in self.key_to_idx.items():
+                        vis_file.write(f"State Key: {state_key:x}\n")
+                        vis_file.write(self.initial_state.with_masks(self.states[idx]).visualize() + "\n\n")
             
             # Get all possible moves from current state
-            moves = current_state.get_possible_moves()
-            
-            for new_state, piece_id, direction in moves:
-                new_hash = new_state.to_hash()
+            moves = get_possible_moves(current_key, current_state, self.move_tables, self.key_offsets)
+            self._add_moves(current_key, current_state, moves)
+            head += 1
+    
+    def _run_parallel_bfs(self, workers: int) -> None:
+        """
+        Fill the nodes and edges with a level-synchronous BFS.
+        Each level is split into chunks whose moves are generated in worker
+        processes; results are merged in order, so the graph matches the
+        serial BFS exactly.
+        """
+        self._add_initial_state()
+        # Nodes are stored in discovery order, so each level is an index range
+        level_start, level_end = 0, 1
+        level = 0
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while level_start < level_end:
+                chunk_starts = range(level_start, level_end, CHUNK_SIZE)
+                results = executor.map(
+                    expand_states,
+                    (self.keys[i:min(i + CHUNK_SIZE, level_end)] for i in chunk_starts),
+                    (self.states[i:min(i + CHUNK_SIZE, level_end)] for i in chunk_starts),
+                    repeat(self.move_tables),
+                    repeat(self.key_offsets)
+                )
                 
-                # Add edge
-                edge = {
-                    'source': current_hash,
-                    'target': new_hash,
-                    'piece_id': piece_id,
-                    'direction': direction
-                }
-                self.edges.append(edge)
+                current_idx = level_start
+                for chunk_moves in results:
+                    for moves in chunk_moves:
+                        self._add_moves(self.keys[current_idx], self.states[current_idx], moves)
+                        current_idx += 1
                 
-                # If new state hasn't been visited, add to queue
-                if new_hash not in self.visited_states and new_hash not in queued_states:
-                    queue.append(new_state)
-                    queued_states.add(new_hash)
+                level += 1
+                print(f"Level {level}: {level_end - level_start} states, "
+                      f"Total discovered states: {len(self.states)}")
+                level_start, level_end = level_end, len(self.states)
+    
+    def _add_moves(self, current_key: int, current_state: Tuple[int, ...],
+                   moves: List[Tuple[int, int, int]]) -> None:
+        """
+        Record the edges for the moves of one state, appending newly
+        discovered states to the node list.
+        Must be called once per state in node order, as it closes the
+        state's row of edge_offsets.
+        """
+        for new_key, i, direction in moves:
+            # If new state hasn't been visited, give it the next index
+            new_idx = self.key_to_idx.get(new_key, -1)
+            if new_idx < 0:
+                new_idx = len(self.states)
+                self.key_to_idx[new_key] = new_idx
+                self.keys.append(new_key)
+                # The keys only differ in piece i's bits, which are old ^ new mask
+                new_mask = current_state[i] ^ ((new_key ^ current_key) >> self.key_offsets[i])
+                self.states.append(current_state[:i] + (new_mask,) + current_state[i + 1:])
             
-            self.visited_states[current_hash] = current_state
+            # Add edge
+            self.edge_tgt.append(new_idx)
+            self.edge_piece.append(self.piece_ids[i])
+            self.edge_dir.append(direction)
         
-        print("\nState space computation complete!")
-        print(f"Total unique states: {len(self.visited_states)}")
-        print(f"Total edges: {len(self.edges)}")
+        self.edge_offsets.append(len(self.edge_tgt))
+    
+    def _run_array_bfs(self, bfs) -> None:
+        """Fill the nodes and edges from the array BFS `bfs` (_bfs.bfs or _frontier.bfs)"""
+        pieces = self.initial_state.pieces
+        shape_classes = self.initial_state.shape_classes
+        codes = np.array([shape_classes[(p.width, p.height)] + 1 for p in pieces], dtype=np.int64)
+        shifts = np.array([dx + dy * self.board_width for dx, dy, _ in DIRECTIONS], dtype=np.int64)
         
-        return self.create_graph_json()
+        states, edge_offsets, edge_tgt, edge_piece, edge_dir = bfs(
+            np.array(self.initial_state.masks, dtype=np.int64),
+            codes,
+            key_bits(len(shape_classes)),
+            self.initial_state.board_width * self.initial_state.board_height,
+            np.array(self.walls, dtype=np.int64),
+            shifts
+        )
+        
+        # Convert back to the states and edges the Python BFS produces; the
+        # Python keys (keys, key_to_idx) are only needed while searching
+        self.states = [tuple(row) for row in states.tolist()]
+        self.edge_offsets = edge_offsets.tolist()
+        self.edge_tgt = edge_tgt.tolist()
+        self.edge_piece = [self.piece_ids[i] for i in edge_piece.tolist()]
+        self.edge_dir = [DIRECTIONS[d][2] for d in edge_dir.tolist()]
     
     def create_graph_json(self) -> Dict:
         """Create JSON-serializable graph structure with optimized format"""
@@ -221,23 +443,30 @@ class KlotskiSolver:
         
         # Create nodes with only position arrays
         nodes = []
-        for state_hash, state in self.visited_states.items():
+        for idx, masks in enumerate(self.states):
             node = {
-                'id': state_hash,
-                'positions': state.to_position_array()
+                'id': idx,
+                'positions': self.initial_state.with_masks(masks).to_position_array()
             }
             nodes.append(node)
         
         return {
             'metadata': {
                 'total_nodes': len(nodes),
-                'total_edges': len(self.edges),
+                'total_edges': len(self.edge_tgt),
                 'board_width': self.initial_state.board_width,
                 'board_height': self.initial_state.board_height
             },
             'pieces': piece_definitions,
             'nodes': nodes,
-            'edges': self.edges
+            # Columnar edges in CSR form: entry k of every other list belongs
+            # to edge k, and node i owns edges offsets[i] to offsets[i + 1]
+            'edges': {
+                'offsets': self.edge_offsets,
+                'target': self.edge_tgt,
+                'piece_id': self.edge_piece,
+                'direction': self.edge_dir
+            }
         }
 
 
@@ -283,6 +512,22 @@ def create_simple_klotski() -> KlotskiState:
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description='Compute the Klotski state space graph')
+    parser.add_argument(
+        '--backend',
+        choices=BACKENDS,
+        default='auto',
+        help='BFS implementation (auto: numba if installed, else numpy)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Worker processes for the python backend'
+    )
+    
+    args = parser.parse_args()
+    
     print("Klotski State Space Generator")
     print("=" * 50)
     
@@ -306,12 +551,13 @@ def main():
     
     # Compute state space
     solver = KlotskiSolver(initial_state)
-    graph_data = solver.compute_state_space()
+    graph_data = solver.compute_state_space(args.backend, args.workers)
     
     # Save to JSON file
     print(f"\nSaving to {output_file}...")
+    # json.dumps without indent runs the C encoder in one shot, unlike json.dump
     with open(output_file, 'w') as f:
-        json.dump(graph_data, f, indent=2)
+        f.write(json.dumps(graph_data, separators=(',', ':')))
     
     print(f"Successfully saved state space to {output_file}")
     print(f"File contains {graph_data['metadata']['total_nodes']} nodes "
@@ -10,10 +10,12 @@ This script:
 
 Binary format:
 - Header: magic bytes, version, counts
-- Metadata: board dimensions, piece info
-- Nodes: indexed by position in file, positions array stored compactly
+- Metadata: board dimensions, piece info (width/height packed as nibbles)
+- Nodes: identified by their index in the file, piece positions packed as
+  one byte (x << 4 | y) per piece
 - Node positions (x,y,z): quantized to 16-bit integers
-- Edges: source/target as node indices, piece_id as u8
+- Edges: adjacency in CSR form, stored as separate column blocks (u32
+  offsets per node + 1, then u32 targets, u8 piece ids, u8 directions)
 
 Output can be loaded efficiently in JavaScript with minimal parsing.
 """
@@ -21,10 +23,13 @@ Output can be loaded efficiently in JavaScript with minimal parsing.
 import json
 import struct
 import zlib
+import hashlib
 import argparse
 from pathlib import Path
 from typing import Dict, List, Tuple, Any
 
+import numpy as np
+
 # Try to import brotli for better web compression
 try:
     import brotli
@@ -34,7 +39,7 @@ except ImportError:
     print("Warning: brotli not available, falling back to gzip")
 
 MAGIC = b'KLGR'  # Klotski Graph
-VERSION = 1
+VERSION = 4
 
 # Quantization settings
 POSITION_SCALE = 1.0  
@@ -47,11 +52,24 @@ def load_json(path: Path) -> Any:
         return json.load(f)
 
 
-def quantize_position(value: float) -> int:
-    """Quantize a float position to int16."""
-    scaled = value * POSITION_SCALE
-    clamped = max(-32768, min(32767, int(round(scaled))))
-    return clamped
+def legacy_node_id(positions: List[List[int]], pieces: List[Dict[str, int]]) -> bytes:
+    """
+    Recompute the MD5 digest that used to identify a state.
+    node_positions.json is keyed by these ids, so they are derived from the
+    piece layout now that nodes are identified by index. This has to stay
+    MD5 for as long as the positions file does; the solver keys states by int.
+    """
+    state = tuple(sorted(
+        (x, y, piece['width'], piece['height'])
+        for (x, y), piece in zip(positions, pieces)
+    ))
+    return hashlib.md5(str(state).encode()).digest()
+
+
+def quantize_positions(values: np.ndarray) -> np.ndarray:
+    """Quantize float positions to little-endian int16."""
+    scaled = np.rint(values * POSITION_SCALE)
+    return np.clip(scaled, -32768, 32767).astype('<i2')
 
 
 def dequantize_position(value: int) -> float:
@@ -75,21 +93,24 @@ def pack_graph(
     positions = load_json(positions_path)
     
     metadata = statespace['metadata']
+    # Piece sizes are packed as nibbles and are bounded by the board size
+    if metadata['board_width'] >= 16 or metadata['board_height'] >= 16:
+        raise ValueError("Board width and height must be at most 15 "
+                         "to fit piece sizes and positions in 4 bits")
     pieces = statespace['pieces']
     nodes = statespace['nodes']
-    edges = statespace['edges']
+    edges = statespace['edges']  # Columnar CSR: offsets per node, one list per field
+    edge_count = len(edges['target'])
     
-    # Build position lookup: id -> (x, y, z)
-    pos_lookup: Dict[str, Tuple[float, float, float]] = {}
+    # Build position lookup: raw MD5 digest -> (x, y, z)
+    pos_lookup: Dict[bytes, Tuple[float, float, float]] = {}
     for p in positions:
-        pos_lookup[p['id']] = (p['x'], p['y'], p['z'])
+        pos_lookup[bytes.fromhex(p['id'])] = (p['x'], p['y'], p['z'])
     
-    # Build node id to index mapping
-    node_id_to_idx: Dict[str, int] = {}
-    for idx, node in enumerate(nodes):
-        node_id_to_idx[node['id']] = idx
+    # Legacy MD5 ids, only used to look up precomputed positions
+    legacy_ids = [legacy_node_id(node['positions'], pieces) for node in nodes]
     
-    print(f"Nodes: {len(nodes)}, Edges: {len(edges)}, Pieces: {len(pieces)}")
+    print(f"Nodes: {len(nodes)}, Edges: {edge_count}, Pieces: {len(pieces)}")
     
     # === Build binary data ===
     binary_parts: List[bytes] = []
@@ -108,7 +129,7 @@ def pack_graph(
         MAGIC,
         VERSION,
         len(nodes),
-        len(edges),
+        edge_count,
         len(pieces),
         metadata['board_width'],
         metadata['board_height'],
@@ -116,63 +137,47 @@ def pack_graph(
     )
     binary_parts.append(header)
     
-    # Pieces (2 bytes each: width u8, height u8)
-    pieces_data = b''.join(
-        struct.pack('<BB', p['width'], p['height'])
-        for p in pieces
-    )
+    # Pieces (1 byte each: width in the high nibble, height in the low nibble)
+    pieces_data = bytes((p['width'] << 4) | p['height'] for p in pieces)
     binary_parts.append(pieces_data)
     
-    # Node IDs (as raw 32 hex chars = 16 bytes each, stored as binary)
-    # This allows direct lookup without string parsing
-    node_ids_data = b''.join(
-        bytes.fromhex(node['id'])
-        for node in nodes
-    )
-    binary_parts.append(node_ids_data)
-    
-    # Node piece positions (10 pieces * 2 coords * 1 byte each = 20 bytes per node)
-    # Each position is [x, y] where x,y are 0-3 (fit in nibbles, but use bytes for simplicity)
-    node_positions_data = b''
-    for node in nodes:
-        pos_list = node['positions']  # List of [x, y] for each piece
-        for px, py in pos_list:
-            node_positions_data += struct.pack('<BB', px, py)
+    # Node piece positions (10 pieces * 1 byte each = 10 bytes per node)
+    # Each position [x, y] fits in nibbles and is stored as x << 4 | y
+    node_positions = np.array([node['positions'] for node in nodes], dtype=np.uint8)
+    packed_positions = (node_positions[:, :, 0] << 4) | node_positions[:, :, 1]
+    node_positions_data = packed_positions.tobytes()  # (nodes, pieces) in C order
     binary_parts.append(node_positions_data)
     
     # 3D positions (6 bytes per node: x, y, z as int16)
-    positions_3d_data = b''
-    missing_positions = 0
-    for node in nodes:
-        nid = node['id']
-        if nid in pos_lookup:
-            x, y, z = pos_lookup[nid]
-            qx = quantize_position(x)
-            qy = quantize_position(y)
-            qz = quantize_position(z)
-            positions_3d_data += struct.pack('<hhh', qx, qy, qz)
-        else:
-            # Node without position - use 0,0,0
-            missing_positions += 1
-            positions_3d_data += struct.pack('<hhh', 0, 0, 0)
+    # Nodes without a precomputed position get 0,0,0
+    xyz = np.fromiter(
+        (pos_lookup.get(legacy_id, (0.0, 0.0, 0.0)) for legacy_id in legacy_ids),
+        dtype=np.dtype((np.float64, 3)),
+        count=len(legacy_ids)
+    )
+    found = np.fromiter(
+        (legacy_id in pos_lookup for legacy_id in legacy_ids),
+        dtype=bool,
+        count=len(legacy_ids)
+    )
+    positions_3d_data = quantize_positions(xyz).tobytes()
     
+    missing_positions = int(np.count_nonzero(~found))
     if missing_positions > 0:
         print(f"Warning: {missing_positions} nodes have no precomputed position")
     
     binary_parts.append(positions_3d_data)
     
-    # Map direction strings to u8 codes
-    direction_map = {'up': 0, 'down': 1, 'left': 2, 'right': 3}
-    
-    # Edges (10 bytes each: source u32, target u32, piece_id u8, direction u8)
-    edges_data = b''
-    for edge in edges:
-        src_idx = node_id_to_idx[edge['source']]
-        tgt_idx = node_id_to_idx[edge['target']]
-        piece_id = edge['piece_id']
-        direction = direction_map.get(edge.get('direction', 'up'), 0)
-        edges_data += struct.pack('<IIBB', src_idx, tgt_idx, piece_id, direction)
-    binary_parts.append(edges_data)
+    # Edges in CSR form (10 bytes per edge + 4 bytes per node), one block per column
+    # - Offsets: u32 * (nodes + 1), node i owns edges offsets[i] to offsets[i + 1]
+    # - Targets: u32 per edge, node indices
+    # - Piece ids: u8 per edge
+    # - Directions: u8 per edge, codes from the solver: up=0, down=1, left=2, right=3
+    # Sources are implied by the offsets, and keeping columns apart compresses better
+    binary_parts.append(np.asarray(edges['offsets'], dtype='<u4').tobytes())
+    binary_parts.append(np.asarray(edges['target'], dtype='<u4').tobytes())
+    binary_parts.append(np.asarray(edges['piece_id'], dtype='u1').tobytes())
+    binary_parts.append(np.asarray(edges['direction'], dtype='u1').tobytes())
     
     # Combine all parts
     raw_data = b''.join(binary_parts)
@@ -205,7 +210,7 @@ def pack_graph(
     # Calculate statistics
     stats = {
         'nodes': len(nodes),
-        'edges': len(edges),
+        'edges': edge_count,
         'pieces': len(pieces),
         'raw_size': len(raw_data),
         'compressed_size': len(compressed),
@@ -317,38 +322,25 @@ function parsePackedGraph(buffer: ArrayBuffer): PackedGraphData {
   const positionScaleRaw = view.getUint16(offset, true); offset += 2;
   const positionScale = positionScaleRaw / 10;
   
-  // Read pieces
+  // Read pieces (1 byte each: width << 4 | height)
   const pieces: Array<{ width: number; height: number }> = [];
   for (let i = 0; i < pieceCount; i++) {
+    const packed = view.getUint8(offset);
     pieces.push({
-      width: view.getUint8(offset),
-      height: view.getUint8(offset + 1),
+      width: packed >> 4,
+      height: packed & 0x0F,
     });
-    offset += 2;
-  }
-  
-  // Read node IDs (16 bytes each, as hex)
-  const nodeIds: string[] = [];
-  const bytes = new Uint8Array(buffer);
-  for (let i = 0; i < nodeCount; i++) {
-    let hex = '';
-    for (let j = 0; j < 16; j++) {
-      hex += bytes[offset + j].toString(16).padStart(2, '0');
-    }
-    nodeIds.push(hex);
-    offset += 16;
+    offset += 1;
   }
   
-  // Read node piece positions (20 bytes per node: 10 pieces * 2 coords)
+  // Read node piece positions (10 bytes per node: 10 pieces * (x << 4 | y))
   const nodePiecePositions: Array<Array<[number, number]>> = [];
   for (let i = 0; i < nodeCount; i++) {
     const positions: Array<[number, number]> = [];
     for (let p = 0; p < pieceCount; p++) {
-      positions.push([
-        view.getUint8(offset),
-        view.getUint8(offset + 1),
-      ]);
-      offset += 2;
+      const packed = view.getUint8(offset);
+      positions.push([packed >> 4, packed & 0x0F]);
+      offset += 1;
     }
     nodePiecePositions.push(positions);
   }
@@ -363,28 +355,38 @@ function parsePackedGraph(buffer: ArrayBuffer): PackedGraphData {
     offset += 6;
   }
   
-  // Combine into nodes array
-  const nodes = nodeIds.map((id, i) => ({
-    id,
+  // Combine into nodes array, nodes are identified by their index
+  const nodes = node3DPositions.map((pos, i) => ({
+    id: String(i),
     positions: nodePiecePositions[i],
-    ...node3DPositions[i],
+    ...pos,
   }));
   
-  // Read edges (10 bytes each: source u32, target u32, piece_id u8, direction u8)
+  // Read edges in CSR form: u32 offsets (nodeCount + 1), then per-edge
+  // columns of u32 targets, u8 piece ids and u8 directions
+  const edgeOffsets = new Uint32Array(nodeCount + 1);
+  for (let i = 0; i <= nodeCount; i++) {
+    edgeOffsets[i] = view.getUint32(offset, true);
+    offset += 4;
+  }
+  const targetsOffset = offset;
+  const pieceIdsOffset = targetsOffset + edgeCount * 4;
+  const directionsOffset = pieceIdsOffset + edgeCount;
+  
   const directionMap = ['up', 'down', 'left', 'right'];
   const edges: Array<{ source: string; target: string; piece_id: number; direction: string }> = [];
-  for (let i = 0; i < edgeCount; i++) {
-    const srcIdx = view.getUint32(offset, true);
-    const tgtIdx = view.getUint32(offset + 4, true);
-    const pieceId = view.getUint8(offset + 8);
-    const directionCode = view.getUint8(offset + 9);
-    edges.push({
-      source: nodeIds[srcIdx],
-      target: nodeIds[tgtIdx],
-      piece_id: pieceId,
-      direction: directionMap[directionCode] || 'up',
-    });
-    offset += 10;
+  for (let srcIdx = 0; srcIdx < nodeCount; srcIdx++) {
+    for (let i = edgeOffsets[srcIdx]; i < edgeOffsets[srcIdx + 1]; i++) {
+      const tgtIdx = view.getUint32(targetsOffset + i * 4, true);
+      const pieceId = view.getUint8(pieceIdsOffset + i);
+      const directionCode = view.getUint8(directionsOffset + i);
+      edges.push({
+        source: String(srcIdx),
+        target: String(tgtIdx),
+        piece_id: pieceId,
+        direction: directionMap[directionCode] || 'up',
+      });
+    }
   }
   
   return {